@@ -1,35 +1,112 @@
+import atexit
+import heapq
+import logging
+import operator
+import os
+import typing
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
 
-from models import API, ExitNow, Group
+from models import API, ExitNow, Group, Location, TimeSlot
 from utils import pretty_print
 
 
+PREFETCH_COUNT = 8
+PREFETCH_TIMEOUT = 5  # seconds to wait on a prefetch before requesting again
+RECENT_COUNT = 3
+RECENT_PATH = '.recent_locations'
+GROUP_MENU = 'Which group?\n' + '\n'.join(f'{i.value}: {i.name}' for i in Group)
+
+if os.environ.get('SG_VACCINES_DEBUG'):
+    logging.basicConfig(level=logging.DEBUG)
+
 client = API()
+atexit.register(client.close)
 
+# one connection is left for requests made from the main thread
+executor = ThreadPoolExecutor(max_workers=client.MAX_WORKERS - 1)
+prefetched: typing.Dict[str, 'Future[typing.Dict[str, typing.List[TimeSlot]]]'] = {}
 
-def print_locations(group: Group) -> None:
+
+def print_locations(group: Group, limit: typing.Optional[int]=20) -> typing.List[Location]:
     """Prints out the locations for a specific group
 
     Arguments
     ---------
     group: Group
         Group from the vaccination drive
+
+    limit: int - Optional
+        Maximum number of locations to print, earliest slot first
+        Should be None to print all locations
+
+    Returns
+    -------
+    The printed locations, earliest slot first
     """
     locations = client.get_locations(group)
-    locations = sorted(locations, key=lambda x: x.earliest_slot.timestamp() if x.earliest_slot else 10**10)
+    total = len(locations)
+    if limit is None:
+        locations = sorted(locations, key=operator.attrgetter('_sort_key'))
+    else:
+        locations = heapq.nsmallest(limit, locations, key=operator.attrgetter('_sort_key'))
 
     header = ('ID', 'Location', 'Earliest Slot', 'Vaccine Type')
 
     values = []
     for loc in locations:
         if loc.earliest_slot:
-            earliest_slot = loc.earliest_slot.strftime(r'%d/%m/%Y %H%Mh')
+            dt = loc.earliest_slot
+            earliest_slot = f'{dt.day:02d}/{dt.month:02d}/{dt.year:04d} {dt.hour:02d}{dt.minute:02d}h'
         else:
             earliest_slot = None
 
         values.append((loc.hci_code, loc.name, earliest_slot, loc.vaccine_type.name))
 
     pretty_print(header, values)
+    if len(locations) < total:
+        print(f'(showing top {len(locations)} of {total})')
+
+    return locations
+
+
+def prefetch_details(hci_codes: typing.Iterable[str]) -> None:
+    """Starts fetching first dose availability in the background,
+    while the user is still picking a location
+
+    Arguments
+    ---------
+    hci_codes: Iterable[str]
+        Vaccination center codes, codes already being fetched are skipped
+    """
+    for hci_code in hci_codes:
+        if hci_code not in prefetched:
+            prefetched[hci_code] = executor.submit(client.get_date_slots, hci_code)
+
+
+def load_recent() -> typing.List[str]:
+    """Returns the vaccination center codes picked in previous runs, most recent first"""
+    try:
+        with open(RECENT_PATH) as f:
+            return f.read().split()[:RECENT_COUNT]
+    except OSError:
+        return []
+
+
+def save_recent(hci_code: str) -> None:
+    """Records a picked vaccination center code for prefetching in later runs
+
+    Arguments
+    ---------
+    hci_code: str
+        Vaccination center code
+    """
+    recent = [hci_code] + [i for i in load_recent() if i != hci_code]
+    try:
+        with open(RECENT_PATH, 'w') as f:
+            f.write('\n'.join(recent[:RECENT_COUNT]))
+    except OSError:
+        pass
 
 
 def print_details(hci_code: str, first_dose_date: datetime=None) -> None:
@@ -46,7 +123,16 @@ def print_details(hci_code: str, first_dose_date: datetime=None) -> None:
         Should be None if there is no first dose
     """
 
-    dateslots = client.get_date_slots(hci_code, first_dose_date)
+    future = prefetched.pop(hci_code, None) if first_dose_date is None else None
+    if future is not None:
+        try:
+            dateslots = future.result(timeout=PREFETCH_TIMEOUT)
+        except Exception:
+            # timed out, or failed while the user was typing, so request again
+            future = None
+
+    if future is None:
+        dateslots = client.get_date_slots(hci_code, first_dose_date)
 
     if not dateslots:
         print('No available timeslots')
@@ -64,17 +150,15 @@ def print_details(hci_code: str, first_dose_date: datetime=None) -> None:
     header = ('Time',)
     values = []
     for i in chosen:
-        time = i.time.strftime(r'%H%Mh')
+        time = f'{i.time.hour:02d}{i.time.minute:02d}h'
         values.append((time,))
 
     pretty_print(header, values)
 
 
-def get_locations() -> None:
+def get_locations() -> typing.List[Location]:
     """Gets the location from user input"""
-    print('Which group?')
-    for i in Group:
-        print(f'{i.value}: {i.name}')
+    print(GROUP_MENU)
 
     try:
         group = Group(int(input()))
@@ -84,16 +168,24 @@ def get_locations() -> None:
     else:
         print(group.name)
         print()
-        print_locations(group)
+        # fetched alongside the locations, as they are likely to be picked again
+        prefetch_details(load_recent())
+        return print_locations(group)
 
 
 def main() -> None:
     try:
-        get_locations()
+        locations = get_locations()
     except ExitNow:
         return
 
+    # the dose is not known yet, so these are wasted if a second dose is picked
+    prefetch_details(loc.hci_code for loc in locations[:PREFETCH_COUNT])
+
     loc_id = input('Location ID: ')
+    if any(loc.hci_code == loc_id for loc in locations):
+        save_recent(loc_id)
+
     try:
         dose = int(input('1: First Dose\n2: Second Dose\nDose number: '))
     except ValueError:
@@ -114,4 +206,9 @@ def main() -> None:
 
 
 if __name__ == '__main__':
-    main()
+    try:
+        main()
+    finally:
+        # drops queued prefetches, the interpreter still waits for running ones
+        # which are bounded by API.TIMEOUT
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -1,8 +1,18 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 from datetime import datetime
 import typing
 from enum import IntEnum
 
+import orjson
 import requests
+from cachecontrol import CacheControlAdapter
+from cachecontrol.caches import FileCache
+from requests.adapters import HTTPAdapter
+from urllib3.util.request import ACCEPT_ENCODING
+from urllib3.util.retry import Retry
 
 from utils import parse_date, get_dates
 
@@ -10,12 +20,19 @@ from utils import parse_date, get_dates
 __all__ = ('Routes', 'Group', 'Location', 'TimeSlot', 'API')
 
 
+log = logging.getLogger(__name__)
+
+
 class Routes:
     BASE = 'https://appointment.vaccine.gov.sg/api/v1'
     APPOINTMENT = BASE + '/appointments/{nric}/{code}'
     LOCATIONS = BASE + '/locations?startDate={start_date}&endDate={end_date}&patientGroupId={group_id}'
     AVAILABILITY = BASE + '/availability/{hci_code}?startDate={start_date}&endDate={end_date}&isFirstAppt={first_dose}'
 
+    # used by API to build the URLs above with f-strings instead of str.format
+    LOCATIONS_PREFIX = BASE + '/locations?startDate='
+    AVAILABILITY_PREFIX = BASE + '/availability/'
+
 
 class Group(IntEnum):
     """Group of people from the vaccination drive"""
@@ -31,54 +48,120 @@ class VaccineType(IntEnum):
     Moderna = 2
 
 
+@dataclass(slots=True)
 class Location:
-    # List[Dict['name', 'hci_code', 'address', 'latitude', 'longitude', 'earliestSlot', 'priority', 'minInterval', 'maxInterval', 'minClinicInterval', 'maxClinicInterval', 'vaccineType']]
-    def __init__(self, api: 'API', data: typing.Dict[str, typing.Union[int, str]]) -> None:
-        self._api = api
-
-        self.name = data.pop('name')
-        self.hci_code = data.pop('hci_code')
-        self.address = data.pop('address', None)
-        self.latitude = data.pop('latitude', None)
-        self.longitude = data.pop('longitude', None)
-        self.earliest_slot = parse_date(data.pop('earliestSlot'))
-        self.priority = data.pop('priority', None)
-        self.min_interval = data.pop('minInterval', None)
-        self.max_interval = data.pop('maxInterval', None)
-        self.min_clinic_interval = data.pop('minClinicInterval', None)
-        self.max_clinic_interval = data.pop('maxClinicInterval', None)
-        self.vaccine_type = VaccineType[data.pop('vaccineType').replace('/', '_')]
+    _api: 'API' = field(repr=False, compare=False)
+    name: str
+    hci_code: str
+    address: typing.Optional[str]
+    latitude: typing.Optional[float]
+    longitude: typing.Optional[float]
+    earliest_slot: typing.Optional[datetime]
+    priority: typing.Optional[int]
+    min_interval: typing.Optional[int]
+    max_interval: typing.Optional[int]
+    min_clinic_interval: typing.Optional[int]
+    max_clinic_interval: typing.Optional[int]
+    vaccine_type: VaccineType
+    _sort_key: float = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        # locations without a slot sort last
+        self._sort_key = self.earliest_slot.timestamp() if self.earliest_slot else float('inf')
+
+    @classmethod
+    def from_api(cls, api: 'API', data: typing.Dict[str, typing.Union[int, str]]) -> 'Location':
+        # Dict['name', 'hci_code', 'address', 'latitude', 'longitude', 'earliestSlot', 'priority', 'minInterval', 'maxInterval', 'minClinicInterval', 'maxClinicInterval', 'vaccineType']
+        return cls(
+            api,
+            name=data['name'],
+            hci_code=data['hci_code'],
+            address=data.get('address'),
+            latitude=data.get('latitude'),
+            longitude=data.get('longitude'),
+            earliest_slot=parse_date(data['earliestSlot']),
+            priority=data.get('priority'),
+            min_interval=data.get('minInterval'),
+            max_interval=data.get('maxInterval'),
+            min_clinic_interval=data.get('minClinicInterval'),
+            max_clinic_interval=data.get('maxClinicInterval'),
+            vaccine_type=VaccineType[data['vaccineType'].replace('/', '_')],
+        )
 
     def get_date_slots(self, first_dose_date: datetime=None) -> typing.Dict[str, typing.List['TimeSlot']]:
         return self._api.get_date_slots(self.hci_code, first_dose_date)
 
 
-class TimeSlot:
-    def __init__(self, api: 'API', data: typing.Dict[str, typing.Union[int, str]]) -> None:
-        self._api = api
-
-        self.id = data.pop('id', None)
-        self.time = parse_date(data.pop('time', None))
-        self.has_capacity = data.pop('hasCapacity')
+class TimeSlot(typing.NamedTuple):
+    id: typing.Optional[int]
+    time: typing.Optional[datetime]
+    has_capacity: bool
 
 
 class API:
+    USER_AGENT = 'sg-vaccines (+https://github.com/fourjr/sg-vaccines)'
+    MAX_WORKERS = 10  # also the adapter's pool_maxsize
+    CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.http_cache')
+    TIMEOUT = 10  # seconds, per connect and per read
+
     def __init__(self) -> None:
         self.session = requests.Session()
-
-    def request(self, endpoint: str, **kwargs: typing.Union[str, int]) -> typing.Dict[str, typing.Union[int, str]]:
-        r = self.session.get(endpoint.format(**kwargs))
-        return r.json()
+        retries = Retry(total=3, backoff_factor=0.3, status_forcelist=(502, 503, 504))
+        self.session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=self.MAX_WORKERS, max_retries=retries))
+        # only the slow changing locations are cached, revalidated with ETag / Last-Modified
+        # requests picks the adapter with the longest matching prefix
+        cache_adapter = CacheControlAdapter(cache=FileCache(self.CACHE_DIR), pool_connections=1, pool_maxsize=1, max_retries=retries)
+        self.session.mount(Routes.BASE + '/locations', cache_adapter)
+        # urllib3 includes br when a brotli decoder is installed
+        self.session.headers.update({'User-Agent': self.USER_AGENT, 'Accept-Encoding': ACCEPT_ENCODING})
+        self._logged_encoding = False
+
+    def close(self) -> None:
+        """Closes the underlying session and its connection pool"""
+        self.session.close()
+
+    def request(self, url: str) -> typing.Dict[str, typing.Union[int, str]]:
+        r = self.session.get(url, timeout=self.TIMEOUT)
+        if not self._logged_encoding:
+            self._logged_encoding = True
+            log.debug('Content-Encoding: %s', r.headers.get('Content-Encoding'))
+        return orjson.loads(r.content)
 
     def get_locations(self, group: Group) -> typing.List[Location]:
         start, end = get_dates()
-        locations = self.request(Routes.LOCATIONS, start_date=start, end_date=end, group_id=int(group))
-        return [Location(self, x) for x in locations]
+        # Routes.LOCATIONS, without parsing the template on every call
+        locations = self.request(f'{Routes.LOCATIONS_PREFIX}{start}&endDate={end}&patientGroupId={group}')
+        return [Location.from_api(self, x) for x in locations]
 
     def get_date_slots(self, hci_code: str, first_dose_date: datetime=None) -> typing.Dict[str, typing.List[TimeSlot]]:
         start, end = get_dates(first_dose_date)
-        r = self.request(Routes.AVAILABILITY, hci_code=hci_code, start_date=start, end_date=end, first_dose=bool(first_dose_date))
-        return {k: [TimeSlot(self, x) for x in v] for k, v in r.items()}
+        # Routes.AVAILABILITY, without parsing the template on every call
+        r = self.request(f'{Routes.AVAILABILITY_PREFIX}{hci_code}?startDate={start}&endDate={end}&isFirstAppt={bool(first_dose_date)}')
+        return {k: [TimeSlot(x.get('id'), parse_date(x.get('time')), x['hasCapacity']) for x in v] for k, v in r.items()}
+
+    def get_many_date_slots(self, hci_codes: typing.Iterable[str], first_dose_date: datetime=None) -> typing.Dict[str, typing.Dict[str, typing.List[TimeSlot]]]:
+        """Fetches the date slots of several vaccination centers concurrently
+
+        Requests share this client's session, so they reuse its pooled connections.
+
+        Arguments
+        ---------
+        hci_codes: Iterable[str]
+            Vaccination center codes
+
+        first_dose_date: datetime.datetime - Optional
+            The date of the first dose
+            Expected to be included if first_dose=False
+            Should be None if there is no first dose
+
+        Returns
+        -------
+        Dict[str, Dict[str, List[TimeSlot]]] -> {hci_code: date_slots}
+        """
+        hci_codes = list(hci_codes)
+        with ThreadPoolExecutor(max_workers=self.MAX_WORKERS) as executor:
+            results = executor.map(lambda code: self.get_date_slots(code, first_dose_date), hci_codes)
+            return dict(zip(hci_codes, results))
 
 
 class ExitNow(BaseException):
@@ -1,11 +1,37 @@
+import calendar
+import io
+import sys
 import typing
-from datetime import datetime
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
 
-import pytz
-from dateutil.relativedelta import relativedelta
 
+__all__ = ('add_months', 'get_dates', 'parse_date', 'pretty_print')
 
-__all__ = ('get_dates', 'parse_date', 'pretty_print')
+
+UTC_OFFSET = timedelta(hours=8)
+
+
+def add_months(dt: datetime, months: int) -> datetime:
+    """Adds calendar months to a date, clamping the day to the end of the month
+
+    Arguments
+    ---------
+    dt: datetime.datetime
+        The date to start from
+
+    months: int
+        Number of months to add
+
+    Returns
+    -------
+    A `datetime.datetime` object
+    """
+    month = dt.month - 1 + months
+    year = dt.year + month // 12
+    month = month % 12 + 1
+    day = min(dt.day, calendar.monthrange(year, month)[1])
+    return dt.replace(year=year, month=month, day=day)
 
 
 def get_dates(first_dose_date: typing.Optional[datetime]=None) -> typing.Tuple[str, str]:
@@ -24,22 +50,19 @@ def get_dates(first_dose_date: typing.Optional[datetime]=None) -> typing.Tuple[s
     """
 
     if first_dose_date is None:
-        tz = pytz.timezone('Asia/Singapore')
-        start_dt = datetime.now(tz)
+        start_dt = datetime.now(ZoneInfo('Asia/Singapore'))
     else:
         start_dt = first_dose_date
 
     if first_dose_date:
-        first_boost = relativedelta(weeks=6)
-        second_boost = relativedelta(weeks=2)
+        start_dt += timedelta(weeks=6)
+        end_dt = start_dt + timedelta(weeks=2)
     else:
-        first_boost = relativedelta(days=1)
-        second_boost = relativedelta(months=3, days=31 - start_dt.day)
+        extra_days = 31 - start_dt.day
+        start_dt += timedelta(days=1)
+        end_dt = add_months(start_dt, 3) + timedelta(days=extra_days)
 
-    start_dt += first_boost
     start_date = start_dt.strftime(r'%Y-%m-%d')
-
-    end_dt = start_dt + second_boost
     end_date = end_dt.strftime(r'%Y-%m-%d')
 
     return (start_date, end_date)
@@ -59,7 +82,12 @@ def parse_date(dt: typing.Optional[str]) -> typing.Optional[typing.Union[datetim
     A `datetime.datetime` object or a str or the original type
     """
     if isinstance(dt, str):
-        dt = datetime.strptime(dt, r'%Y-%m-%dT%H:%M:%S.%fZ') + relativedelta(hours=8)  # convert to UTC+8
+        # the format is fixed, slicing is much faster than strptime
+        dt = datetime(
+            int(dt[0:4]), int(dt[5:7]), int(dt[8:10]),
+            int(dt[11:13]), int(dt[14:16]), int(dt[17:19]),
+            int(dt[20:-1].ljust(6, '0'))
+        ) + UTC_OFFSET  # convert to UTC+8
 
     return dt
 
@@ -82,30 +110,19 @@ def pretty_print(header: typing.Tuple[str], values: typing.List[typing.Tuple[str
     ```
     """
 
-    maxlens = []
-    for i in header:
-        maxlens.append(len(i))
-
-    for val in values:
-        for n, i in enumerate(val):
-            if len(str(i)) > maxlens[n]:
-                maxlens[n] = len(str(i))
-
-    fmt = ''
-    for n, i in enumerate(header):
-        i = str(i)
-        fmt += f'{i:^{maxlens[n] + 3}}'
-    print(fmt)
-
-    fmt = ''
-    for n in range(len(header)):
-        fmt += '-' * (maxlens[n] + 2) + ' '
-    print(fmt)
-
-    for val in values:
-        fmt = ''
-        for n, i in enumerate(val):
-            i = str(i)
-            fmt += f'{i:^{maxlens[n] + 3}}'
-
-        print(fmt)
+    header = tuple(map(str, header))
+    rows = [tuple(map(str, val)) for val in values]
+
+    maxlens = [max(map(len, column)) for column in zip(header, *rows)]
+    row_fmt = ''.join(f'{{:^{w + 3}}}' for w in maxlens) + '\n'
+
+    # written to stdout in one go rather than a print per line
+    buf = io.StringIO()
+    buf.write(row_fmt.format(*header))
+    buf.write(' '.join('-' * (w + 2) for w in maxlens) + ' \n')
+
+    for row in rows:
+        buf.write(row_fmt.format(*row))
+
+    sys.stdout.write(buf.getvalue())
+    sys.stdout.flush()